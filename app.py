@@ -1,30 +1,75 @@
+import hashlib
+import logging
+import os
+import pickle
 import re
+import tempfile
 import unicodedata
+from functools import lru_cache
+from pathlib import Path
 from typing import Optional
 
+import numpy as np
 import pandas as pd
 import streamlit as st
+from rapidfuzz import fuzz, process
 
 
+logger = logging.getLogger(__name__)
+
 APP_TITLE = "Serving Girl Availability Review"
 BASE_CSV_PATH_DEFAULT = "/mnt/data/Serving base with allocated directors.csv"
 
+SHEET_CACHE_DIR = Path.home() / ".cache" / "ukids"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files/"
+
+# Minimum token_sort_ratio for a sheet name to count as a near-match
+FUZZY_SCORE_CUTOFF = 90
+
+# Set after the first failed Drive check so the warning is logged once per process
+_drive_check_warned = False
+
+_WS_RE = re.compile(r"\s+")
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+
 
 def normalize_name(s: str) -> str:
     """
     Normalize names so comparisons are robust:
     - strip whitespace
+    - remove accents (NFKD, then drop combining marks)
     - collapse repeated spaces
-    - remove accents
     - lowercase
+
+    Letters without an ASCII form ("ø", "ß", Cyrillic, ...) are kept.
+
+    Must stay in step with normalize_name_series, which builds the keys
+    this is compared against.
     """
     if s is None:
         return ""
-    s = str(s).strip()
-    s = re.sub(r"\s+", " ", s)
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    return s.lower().strip()
+    return _normalize_name_cached(str(s))
+
+
+@lru_cache(maxsize=4096)
+def _normalize_name_cached(s: str) -> str:
+    s = s.strip()
+    if not s.isascii():
+        s = "".join(ch for ch in unicodedata.normalize("NFKD", s) if not unicodedata.combining(ch))
+    return _WS_RE.sub(" ", s.lower()).strip()
+
+
+def normalize_name_series(s: pd.Series) -> pd.Series:
+    """
+    Vectorized normalize_name for a whole column.
+    """
+    raw = s.astype(str)
+    out = raw.str.lower().str.replace(_WS_RE, " ", regex=True).str.strip()
+    # Only non-ASCII names need accent stripping; those take the (cached) scalar path
+    non_ascii = raw.str.contains(_NON_ASCII_RE)
+    if non_ascii.any():
+        out[non_ascii] = raw[non_ascii].map(normalize_name)
+    return out
 
 
 @st.cache_data(ttl=20, show_spinner=False)
@@ -36,20 +81,23 @@ def load_serving_base(csv_path: str) -> pd.DataFrame:
     required = {"Director", "Serving Girl"}
     if not required.issubset(set(df.columns)):
         raise ValueError(f"CSV must contain columns: {sorted(required)}. Found: {list(df.columns)}")
-    df["Director_norm"] = df["Director"].apply(normalize_name)
-    df["ServingGirl_norm"] = df["Serving Girl"].apply(normalize_name)
+    df["Director_norm"] = normalize_name_series(df["Director"])
+    df["ServingGirl_norm"] = normalize_name_series(df["Serving Girl"])
     return df
 
 
-def get_sheet_df_from_gspread(
-    spreadsheet_id: str,
-    worksheet_name: Optional[str] = None,
-) -> pd.DataFrame:
+def _sheet_cache_path(spreadsheet_id: str, worksheet_name: Optional[str]) -> Path:
+    # Hashed so distinct worksheet names can never share a cache file
+    key = hashlib.sha256(f"{spreadsheet_id}\0{worksheet_name or ''}".encode()).hexdigest()
+    return SHEET_CACHE_DIR / f"{key}.pkl"
+
+
+@st.cache_resource(show_spinner=False)
+def _get_credentials():
     """
-    Reads the Google Sheet into a DataFrame.
-    Uses a Service Account JSON stored in st.secrets["gcp_service_account"].
+    Service account credentials from st.secrets["gcp_service_account"],
+    built once per process.
     """
-    import gspread
     from google.oauth2.service_account import Credentials
 
     if "gcp_service_account" not in st.secrets:
@@ -62,18 +110,109 @@ def get_sheet_df_from_gspread(
         "https://www.googleapis.com/auth/spreadsheets.readonly",
         "https://www.googleapis.com/auth/drive.readonly",
     ]
-    creds = Credentials.from_service_account_info(dict(st.secrets["gcp_service_account"]), scopes=scopes)
-    gc = gspread.authorize(creds)
+    return Credentials.from_service_account_info(dict(st.secrets["gcp_service_account"]), scopes=scopes)
 
-    sh = gc.open_by_key(spreadsheet_id)
+
+@st.cache_resource(show_spinner=False)
+def _get_gc():
+    import gspread
+
+    return gspread.authorize(_get_credentials())
+
+
+@st.cache_resource(show_spinner=False)
+def _get_drive_session():
+    from google.auth.transport.requests import AuthorizedSession
+
+    return AuthorizedSession(_get_credentials())
+
+
+def _sheet_modified_time(spreadsheet_id: str) -> Optional[str]:
+    """
+    Asks Drive for the spreadsheet's modifiedTime (a tiny metadata call).
+    Returns None if it can't be determined, which forces a full download.
+    """
+    try:
+        resp = _get_drive_session().get(
+            DRIVE_FILES_URL + spreadsheet_id,
+            params={"fields": "modifiedTime", "supportsAllDrives": "true"},
+            timeout=10,
+        )
+        resp.raise_for_status()
+        return resp.json().get("modifiedTime")
+    except Exception:
+        global _drive_check_warned
+        if not _drive_check_warned:
+            _drive_check_warned = True
+            logger.warning(
+                "Drive modifiedTime check failed; the sheet will be downloaded on every load",
+                exc_info=True,
+            )
+        return None
+
+
+def _write_sheet_cache(cache_path: Path, payload: dict) -> None:
+    """
+    Writes the frame and its metadata as one file, via a temp file and
+    os.replace, so concurrent downloads can never leave a frame paired
+    with another download's modifiedTime. Caching is best-effort.
+    """
+    tmp_name = None
+    try:
+        SHEET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=SHEET_CACHE_DIR, suffix=".tmp", delete=False) as f:
+            tmp_name = f.name
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, cache_path)
+    except (OSError, pickle.PicklingError):
+        if tmp_name is not None:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+
+
+def get_sheet_df_from_gspread(
+    spreadsheet_id: str,
+    worksheet_name: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Reads the Google Sheet into a DataFrame.
+    Uses a Service Account JSON stored in st.secrets["gcp_service_account"].
+    The authorized clients are reused across reruns, and the last download
+    is kept on disk and reused while the spreadsheet's Drive modifiedTime
+    hasn't changed.
+    """
+    # Raises the missing-secrets error up front rather than hiding it in the Drive check
+    _get_credentials()
+
+    cache_path = _sheet_cache_path(spreadsheet_id, worksheet_name)
+    modified = _sheet_modified_time(spreadsheet_id)
+    cache_meta = {
+        "spreadsheet_id": spreadsheet_id,
+        "worksheet_name": worksheet_name or "",
+        "modifiedTime": modified,
+    }
+    if modified:
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached["meta"] == cache_meta:
+                return cached["df"]
+        except Exception:
+            pass  # missing or unreadable cache: fall through to a full download
+
+    sh = _get_gc().open_by_key(spreadsheet_id)
     ws = sh.worksheet(worksheet_name) if worksheet_name else sh.sheet1
 
-    # Assumes first row is headers
-    records = ws.get_all_records()
-    df = pd.DataFrame(records)
-    # Ensure string columns don’t become NaN
-    df = df.fillna("")
-    df.columns = [str(c).strip() for c in df.columns]
+    # Assumes first row is headers; raw values keep every cell a string
+    values = ws.get_all_values()
+    if not values:
+        return pd.DataFrame()
+    df = pd.DataFrame(values[1:], columns=[str(c).strip() for c in values[0]])
+
+    if modified:
+        _write_sheet_cache(cache_path, {"meta": cache_meta, "df": df})
     return df
 
 
@@ -83,35 +222,61 @@ def load_google_sheet(
     worksheet_name: Optional[str],
     name_col: str,
     reason_col: str,
-) -> pd.DataFrame:
+) -> dict:
+    """
+    Returns the sheet's name_norm -> reason index (see build_reason_index).
+    Only the index is cached, so reruns don't unpickle the whole sheet.
+    """
     df = get_sheet_df_from_gspread(spreadsheet_id, worksheet_name)
 
     if name_col not in df.columns:
         raise ValueError(f"Name column '{name_col}' not found in sheet. Found: {list(df.columns)}")
     if reason_col not in df.columns:
         raise ValueError(f"Reason column '{reason_col}' not found in sheet. Found: {list(df.columns)}")
+    for col in (name_col, reason_col):
+        if (df.columns == col).sum() > 1:
+            raise ValueError(f"Column '{col}' appears more than once in the sheet header. Found: {list(df.columns)}")
 
-    df["name_norm"] = df[name_col].apply(normalize_name)
-    df["reason_clean"] = df[reason_col].astype(str).fillna("").apply(lambda x: x.strip())
-    return df
+    df["name_norm"] = normalize_name_series(df[name_col])
+    df["reason_clean"] = df[reason_col].fillna("").astype(str).str.strip()
+    return build_reason_index(df)
 
 
-def compute_status(sheet_df: pd.DataFrame, serving_girl_name: str) -> dict:
+def build_reason_index(sheet_df: pd.DataFrame) -> dict:
     """
-    Returns:
-      {"status": "Done"/"Review"/"Not submitted", "reason": "..."}
+    Maps name_norm -> reason_clean. If a name appears more than once,
+    the first row wins (matches the old per-name scan).
     """
-    sg_norm = normalize_name(serving_girl_name)
-    match = sheet_df[sheet_df["name_norm"] == sg_norm]
+    first = sheet_df.drop_duplicates("name_norm", keep="first")
+    return dict(zip(first["name_norm"], first["reason_clean"]))
 
-    if match.empty:
-        return {"status": "Not submitted", "reason": ""}
 
-    # If multiple matches, take the first (you can improve this by using latest timestamp if you have one)
-    reason = str(match.iloc[0]["reason_clean"]).strip()
-    if reason == "":
-        return {"status": "Done", "reason": ""}
-    return {"status": "Review", "reason": reason}
+def match_all(girls_norm: list, sheet_norm: list) -> np.ndarray:
+    """
+    Similarity matrix (girls x sheet names) in one rapidfuzz call, spread
+    over all cores. Scores below FUZZY_SCORE_CUTOFF come back as 0.
+    """
+    return process.cdist(
+        girls_norm,
+        sheet_norm,
+        # Not token_set_ratio: it scores a subset ("anna" vs "anna jones") as 100
+        scorer=fuzz.token_sort_ratio,
+        score_cutoff=FUZZY_SCORE_CUTOFF,
+        workers=-1,
+    )
+
+
+def nearest_sheet_names(girls_norm: list, sheet_names: list) -> list:
+    """
+    For each normalized girl name, the closest sheet name scoring at
+    least FUZZY_SCORE_CUTOFF, or None.
+    """
+    if not girls_norm or not sheet_names:
+        return [None] * len(girls_norm)
+    scores = match_all(girls_norm, sheet_names)
+    best = scores.argmax(axis=1)
+    best_scores = scores[np.arange(len(best)), best]
+    return [sheet_names[j] if score >= FUZZY_SCORE_CUTOFF else None for j, score in zip(best, best_scores)]
 
 
 def badge(status: str) -> str:
@@ -148,7 +313,11 @@ def main():
         st.error(f"Could not load serving base CSV: {e}")
         st.stop()
 
-    directors = sorted(base_df["Director"].unique(), key=lambda x: normalize_name(x))
+    directors = (
+        base_df.drop_duplicates("Director")
+        .sort_values("Director_norm", kind="stable")["Director"]
+        .tolist()
+    )
 
     st.subheader("Select Director")
     director = st.selectbox("Director", directors, index=0)
@@ -169,7 +338,7 @@ def main():
         st.stop()
 
     try:
-        sheet_df = load_google_sheet(
+        name_to_reason = load_google_sheet(
             spreadsheet_id=sheet_id,
             worksheet_name=worksheet_name if worksheet_name else None,
             name_col=sheet_name_col,
@@ -181,23 +350,41 @@ def main():
 
     # ---- Filter serving girls for this director ----
     director_norm = normalize_name(director)
-    girls_df = base_df[base_df["Director_norm"] == director_norm].copy()
-    girls = sorted(girls_df["Serving Girl"].tolist(), key=lambda x: normalize_name(x))
+    girls_df = base_df.loc[base_df["Director_norm"] == director_norm, ["Serving Girl", "ServingGirl_norm"]]
+    girls_df = girls_df.sort_values("ServingGirl_norm", kind="stable")
 
     st.subheader(f"Serving Girls for {director}")
-    if not girls:
+    if girls_df.empty:
         st.info("No serving girls found for this director in the serving base file.")
         st.stop()
 
     # ---- Compute statuses ----
-    results = []
-    for g in girls:
-        r = compute_status(sheet_df, g)
-        results.append((g, r["status"], r["reason"]))
-
-    done_count = sum(1 for _, s, _ in results if s == "Done")
-    review_count = sum(1 for _, s, _ in results if s == "Review")
-    not_count = sum(1 for _, s, _ in results if s == "Not submitted")
+    # One vectorized lookup against the prebuilt index instead of a lookup per girl
+    merged = girls_df.assign(reason_clean=girls_df["ServingGirl_norm"].map(name_to_reason))
+    merged["status"] = np.select(
+        [merged["reason_clean"].isna(), merged["reason_clean"].eq("")],
+        ["Not submitted", "Done"],
+        default="Review",
+    )
+    merged["reason_clean"] = merged["reason_clean"].fillna("")
+    merged["matched"] = ""
+
+    # Near-miss spellings ("OBrien" vs "O'Brien") are flagged for review instead of "Not submitted"
+    # Sheet names that belong to someone in the serving base are never near-match candidates
+    known = set(base_df["ServingGirl_norm"])
+    candidates = [n for n in name_to_reason if n not in known]
+    missing = merged["status"].eq("Not submitted") & merged["ServingGirl_norm"].ne("")
+    if missing.any():
+        nearest = nearest_sheet_names(merged.loc[missing, "ServingGirl_norm"].tolist(), candidates)
+        matched = pd.Series(nearest, index=merged.index[missing], dtype=object).dropna()
+        merged.loc[matched.index, "status"] = "Review"
+        merged.loc[matched.index, "reason_clean"] = matched.map(name_to_reason)
+        merged.loc[matched.index, "matched"] = matched
+
+    counts = merged["status"].value_counts()
+    done_count = int(counts.get("Done", 0))
+    review_count = int(counts.get("Review", 0))
+    not_count = int(counts.get("Not submitted", 0))
 
     m1, m2, m3 = st.columns(3)
     m1.metric("Done", done_count)
@@ -206,19 +393,19 @@ def main():
 
     st.divider()
 
-    # ---- Display list with feedback ----
-    for name, status, reason in results:
-        row = st.container()
-        c1, c2 = row.columns([3, 2])
-        with c1:
-            st.write(f"**{name}**")
-        with c2:
-            st.write(badge(status))
-
-        if status == "Review" and reason:
-            st.caption(f"Reason: {reason}")
-
-        st.write("")  # spacing
+    # ---- Display table with feedback ----
+    # A single dataframe widget instead of a container + columns per serving girl
+    table = pd.DataFrame(
+        {
+            "Serving Girl": merged["Serving Girl"],
+            "Status": merged["status"].map(badge),
+            "Reason": merged["reason_clean"],
+            "Closest sheet name": merged["matched"],
+        }
+    )
+    if not table["Closest sheet name"].any():
+        table = table.drop(columns="Closest sheet name")
+    st.dataframe(table, hide_index=True, width="stretch")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("rapidfuzz")
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+
+
+def test_normalize_name_series_matches_scalar():
+    # The two paths build the keys that get compared; any drift turns submitted girls into "Not submitted"
+    names = [
+        "  José   García ",
+        "Zoë\tSmith",
+        "Anna\u00a0Jones",
+        "Søren",
+        "Straße",
+        "STRAUSS",
+        "Мария K",
+        "Анна  K",
+        "王 芳",
+        "O'Brien",
+        "",
+        "   ",
+    ]
+    assert app.normalize_name_series(pd.Series(names)).tolist() == [app.normalize_name(n) for n in names]
+
+
+def test_normalize_name_keeps_letters_without_ascii_form():
+    assert app.normalize_name(" Zoë\u00a0 Søren ") == "zoe søren"
+    assert app.normalize_name("Мария K") != app.normalize_name("Анна K")
+
+
+def test_nearest_sheet_names_ignores_token_subset():
+    # "Anna" is a subset of "Anna Jones" but not the same person
+    assert app.nearest_sheet_names(["anna jones"], ["anna"]) == [None]
+
+
+def test_nearest_sheet_names_matches_close_spelling():
+    assert app.nearest_sheet_names(["obrien", "mary smith"], ["o'brien", "anna"]) == ["o'brien", None]
+
+
+def test_nearest_sheet_names_without_candidates():
+    assert app.nearest_sheet_names(["anna jones"], []) == [None]
+
+
+class _FakeWorksheet:
+    def __init__(self, book, name):
+        self.book = book
+        self.name = name
+
+    def get_all_values(self):
+        self.book.downloads.append(self.name)
+        return [["Serving Girl", "Reason"], [self.book.rows[self.name], ""]]
+
+
+class _FakeSpreadsheet:
+    def __init__(self):
+        self.rows = {"Sheet1": "anna", "sheet1": "dee", "Ответы": "bea", "Данные": "cara"}
+        self.downloads = []
+        self.sheet1 = _FakeWorksheet(self, "Sheet1")
+
+    def worksheet(self, name):
+        return _FakeWorksheet(self, name)
+
+
+@pytest.fixture
+def sheet_cache(monkeypatch, tmp_path):
+    """
+    Points the disk cache at tmp_path and stubs out Google. Set
+    sheet_cache.modified to control what the Drive check returns.
+    """
+    book = _FakeSpreadsheet()
+    book.modified = "t1"
+    gc = type("FakeClient", (), {"open_by_key": lambda self, key: book})()
+    monkeypatch.setattr(app, "SHEET_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(app, "_get_credentials", lambda: None)
+    monkeypatch.setattr(app, "_get_gc", lambda: gc)
+    monkeypatch.setattr(app, "_sheet_modified_time", lambda spreadsheet_id: book.modified)
+    return book
+
+
+def _first_name(df):
+    return df["Serving Girl"].iloc[0]
+
+
+def test_sheet_cache_hit_skips_download(sheet_cache):
+    app.get_sheet_df_from_gspread("ID")
+    assert _first_name(app.get_sheet_df_from_gspread("ID")) == "anna"
+    assert sheet_cache.downloads == ["Sheet1"]
+
+
+def test_sheet_cache_changed_modified_time_downloads_again(sheet_cache):
+    app.get_sheet_df_from_gspread("ID")
+    sheet_cache.rows["Sheet1"] = "anna v2"
+    sheet_cache.modified = "t2"
+    assert _first_name(app.get_sheet_df_from_gspread("ID")) == "anna v2"
+    assert sheet_cache.downloads == ["Sheet1", "Sheet1"]
+
+
+def test_sheet_cache_unknown_modified_time_never_caches(sheet_cache, tmp_path):
+    sheet_cache.modified = None
+    app.get_sheet_df_from_gspread("ID")
+    app.get_sheet_df_from_gspread("ID")
+    assert sheet_cache.downloads == ["Sheet1", "Sheet1"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sheet_cache_is_separate_per_worksheet(sheet_cache):
+    # Same length non-ASCII names and None vs "sheet1" used to share cache files
+    expected = {None: "anna", "sheet1": "dee", "Ответы": "bea", "Данные": "cara"}
+    for name in expected:
+        app.get_sheet_df_from_gspread("ID", name)
+    for name, first in expected.items():
+        assert _first_name(app.get_sheet_df_from_gspread("ID", name)) == first
+    assert sheet_cache.downloads == ["Sheet1", "sheet1", "Ответы", "Данные"]
+
+
+def test_sheet_cache_keeps_frame_and_modified_time_paired(sheet_cache, monkeypatch):
+    # Download B (t3) is about to store its result when an older download A
+    # (t2) finishes and stores its own. Whatever wins, the stored frame must
+    # belong to the stored modifiedTime.
+    real_replace = app.os.replace
+
+    def replace_after_download_a(src, dst):
+        monkeypatch.setattr(app.os, "replace", real_replace)
+        sheet_cache.modified = "t2"
+        sheet_cache.rows["Sheet1"] = "v2"
+        app.get_sheet_df_from_gspread("ID")
+        real_replace(src, dst)
+
+    sheet_cache.modified = "t3"
+    sheet_cache.rows["Sheet1"] = "v3"
+    monkeypatch.setattr(app.os, "replace", replace_after_download_a)
+    app.get_sheet_df_from_gspread("ID")
+
+    sheet_cache.modified = "t3"
+    assert _first_name(app.get_sheet_df_from_gspread("ID")) == "v3"
+    sheet_cache.modified = "t2"
+    assert _first_name(app.get_sheet_df_from_gspread("ID")) == "v2"
+    assert sheet_cache.downloads == ["Sheet1", "Sheet1", "Sheet1"]